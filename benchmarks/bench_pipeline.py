@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Stage benchmarks for the ebook pipeline.
+
+Times get_album_data, LyricsAnnotator.annotate_lyrics and create_epub
+separately on synthetic albums (or a recorded fixture) served by the offline
+Genius stub, and writes the results as JSON so runs can be compared between
+commits. create_epub is timed once per EPUB compression mode, with the size of
+the book each mode writes.
+
+    python benchmarks/bench_pipeline.py --sizes 10 100 1000 --output bench_results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import genius_2_ebook  # noqa: E402
+from genius_stub import StubSession, load_fixture, make_fixture  # noqa: E402
+
+
+def git_commit():
+    try:
+        # the checkout being benchmarked, wherever the script is run from
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(func, repeat):
+    """Run func `repeat` times, returning the best wall time and the last result."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # the pipeline reports progress with print, keep it out of the timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_fixture(fixture, workers, repeat, compressions):
+    session = StubSession(fixture)
+    genius = genius_2_ebook.create_genius_client("benchmark-token")
+    genius._session = session
+    genius.verbose = False
+    album_name = fixture["album"]["name"]
+    artist_name = fixture["album"]["artist"]["name"]
+
+    fetch_time, album = timed(
+        lambda: genius_2_ebook.get_album_data(artist_name, album_name, None, workers, genius=genius),
+        repeat)
+    requests_per_fetch = session.requests // repeat
+
+    lyrics = [(track, track.song.lyrics.replace("Lyrics", "", 1).strip()) for track in album.tracks]
+    annotate_time, _ = timed(
+        lambda: [genius_2_ebook.LyricsAnnotator(track.annotations, text).annotate_lyrics()
+                 for track, text in lyrics],
+        repeat)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        cwd = os.getcwd()
+        os.chdir(out_dir)
+        try:
+            write = {}
+            for mode in compressions:
+                seconds, path = timed(lambda: genius_2_ebook.create_epub(album, "epub", mode), repeat)
+                write[mode] = {"create_epub_s": round(seconds, 4), "epub_bytes": os.path.getsize(path)}
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "tracks": len(fixture["tracks"]),
+        "annotations": sum(len(refs) for refs in fixture["referents"].values()),
+        "requests": requests_per_fetch,
+        "get_album_data_s": round(fetch_time, 4),
+        "annotate_lyrics_s": round(annotate_time, 4),
+        **write.get("default", next(iter(write.values()))),
+        "compression": write,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fetch, annotate and write stages offline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Synthetic album sizes in tracks (default: 10 100 1000)")
+    parser.add_argument("--annotations-per-track", type=int, default=20,
+                        help="Referents per synthetic track (default: 20)")
+    parser.add_argument("--fixture", action="append", default=[],
+                        help="Recorded fixture JSON to benchmark as well (repeatable)")
+    parser.add_argument("--compression", nargs="+", choices=list(genius_2_ebook.EPUB_COMPRESSION),
+                        default=list(genius_2_ebook.EPUB_COMPRESSION),
+                        help="EPUB compression modes to time create_epub with (default: all)")
+    parser.add_argument("--workers", type=int, default=4, help="Fetch workers (default: 4)")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="Chapter render processes used by create_epub (default: 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage, best is kept (default: 3)")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    # The stub answers instantly, so pacing would only measure the limiter
+    genius_2_ebook.rate_limiter.configure(max_rate=1e9)
+    genius_2_ebook.chapter_renderer.configure(max_workers=args.render_workers)
+
+    fixtures = [(f"synthetic-{size}", make_fixture(size, args.annotations_per_track)) for size in args.sizes]
+    fixtures += [(os.path.basename(path), load_fixture(path)) for path in args.fixture]
+
+    results = []
+    for name, fixture in fixtures:
+        result = bench_fixture(fixture, args.workers, args.repeat, args.compression)
+        result["name"] = name
+        results.append(result)
+        print(f"{name}: fetch {result['get_album_data_s']}s, annotate {result['annotate_lyrics_s']}s, "
+              f"write {result['create_epub_s']}s ({result['requests']} requests)")
+        for mode, write in result["compression"].items():
+            print(f"  {mode}: {write['create_epub_s']}s, {write['epub_bytes']} bytes")
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workers": args.workers,
+        "render_workers": args.render_workers,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
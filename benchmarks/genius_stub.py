@@ -0,0 +1,172 @@
+"""
+Offline stand-in for the Genius API used by the benchmarks.
+
+A fixture holds the album, its tracks, every song's lyrics and referents as
+plain JSON - either recorded from the real API or generated by make_fixture.
+StubSession answers the requests lyricsgenius makes from that fixture, so the
+whole client stack (cache, rate limiter, paging) runs without a network.
+"""
+
+import json
+import re
+from urllib.parse import urlparse
+
+import requests
+
+
+ARTIST = {
+    "id": 1,
+    "api_path": "/artists/1",
+    "header_image_url": "",
+    "image_url": "",
+    "is_meme_verified": False,
+    "is_verified": False,
+    "name": "Bench Artist",
+    "url": "https://genius.com/artists/Bench-artist",
+}
+
+WORDS = ("night", "river", "heart", "light", "city", "dream", "fire", "rain",
+         "road", "home", "stone", "sky", "gold", "wind", "song", "time")
+
+
+def _song_body(song_id, number):
+    slug = f"bench-artist-track-{number}-lyrics"
+    return {
+        "id": song_id,
+        "primary_artist": ARTIST,
+        "stats": {},
+        "annotation_count": 0,
+        "api_path": f"/songs/{song_id}",
+        "full_title": f"Track {number} by Bench Artist",
+        "header_image_thumbnail_url": "",
+        "header_image_url": "",
+        "lyrics_owner_id": 1,
+        "lyrics_state": "complete",
+        "path": f"/{slug}",
+        "pyongs_count": 0,
+        "song_art_image_thumbnail_url": "",
+        "song_art_image_url": "",
+        "title": f"Track {number}",
+        "title_with_featured": f"Track {number}",
+        "url": f"https://genius.com/{slug}",
+        "instrumental": False,
+    }
+
+
+def make_fixture(tracks, annotations_per_track, lines_per_track=40, seed=0):
+    """Generate a synthetic album fixture with distinct, annotatable lyric lines."""
+    album = {
+        "id": 1,
+        "artist": ARTIST,
+        "name": f"Bench Album {tracks}",
+        "full_title": f"Bench Album {tracks} by Bench Artist",
+        "cover_art_url": None,
+        "url": "",
+        "api_path": "/albums/1",
+        "release_date_components": {"year": 2000, "month": 1, "day": 1},
+    }
+    fixture = {"album": album, "tracks": [], "lyrics": {}, "referents": {}}
+    for number in range(1, tracks + 1):
+        song_id = 1000 + number
+        song = _song_body(song_id, number)
+        song["annotation_count"] = annotations_per_track
+        lines = []
+        for line in range(lines_per_track):
+            words = [WORDS[(seed + number * 7 + line * 3 + k) % len(WORDS)] for k in range(5)]
+            lines.append(f"{' '.join(words)} it's line {line} of track {number}")
+        fixture["tracks"].append({"number": number, "song": song})
+        fixture["lyrics"][str(song_id)] = f"Track {number} Lyrics\n" + "\n".join(lines)
+        fixture["referents"][str(song_id)] = [
+            {"fragment": lines[k % lines_per_track],
+             "annotations": [{"body": {"plain": f"Note {k} on track {number}."}}]}
+            for k in range(annotations_per_track)
+        ]
+    return fixture
+
+
+def load_fixture(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StubResponse:
+    def __init__(self, status_code=200, data=None, text=None, content=None):
+        self.status_code = status_code
+        self.headers = {}
+        self._data = data
+        if content is None:
+            content = (json.dumps({"response": data}) if data is not None else (text or "")).encode("utf-8")
+        self.content = content
+        self.text = text if text is not None else content.decode("utf-8", "replace")
+
+    def json(self):
+        return {"response": self._data}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code), response=self)
+
+
+class StubSession:
+    """Drop-in for the requests.Session lyricsgenius uses, serving a fixture."""
+
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.headers = {}
+        self.proxies = {}
+        self.requests = 0
+        self._songs = {track["song"]["id"]: track["song"] for track in fixture["tracks"]}
+        self._by_path = {song["path"]: song_id for song_id, song in self._songs.items()}
+        self._by_title = {song["title"].lower(): song for song in self._songs.values()}
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def request(self, method, url, params=None, **kwargs):
+        self.requests += 1
+        params = params or {}
+        parsed = urlparse(url)
+        path = parsed.path
+
+        if parsed.netloc == "genius.com" and not path.startswith("/api/"):
+            song_id = self._by_path.get(path)
+            if song_id is None:
+                return StubResponse(404, text="")
+            lyrics = self.fixture["lyrics"].get(str(song_id), "")
+            return StubResponse(text=f'<div class="Lyrics__Container">{lyrics.replace(chr(10), "<br/>")}</div>')
+        if parsed.netloc not in ("api.genius.com", "genius.com"):
+            return StubResponse(404, text="")
+
+        path = re.sub(r"^/api", "", path)
+        album = self.fixture["album"]
+        if path == "/search/multi":
+            return StubResponse(data=self._search(params.get("q", "")))
+        if path == f"/albums/{album['id']}":
+            return StubResponse(data={"album": album})
+        if path == f"/albums/{album['id']}/tracks":
+            per_page = int(params.get("per_page") or 20)
+            page = int(params.get("page") or 1)
+            tracks = self.fixture["tracks"][(page - 1) * per_page:page * per_page]
+            next_page = page + 1 if page * per_page < len(self.fixture["tracks"]) else None
+            return StubResponse(data={"tracks": tracks, "next_page": next_page})
+        match = re.fullmatch(r"/songs/(\d+)", path)
+        if match and int(match.group(1)) in self._songs:
+            return StubResponse(data={"song": self._songs[int(match.group(1))]})
+        if path == f"/artists/{ARTIST['id']}":
+            return StubResponse(data={"artist": album["artist"]})
+        if path == "/referents":
+            referents = self.fixture["referents"].get(str(params.get("song_id")), [])
+            per_page = int(params.get("per_page") or 20)
+            page = int(params.get("page") or 1)
+            return StubResponse(data={"referents": referents[(page - 1) * per_page:page * per_page]})
+        return StubResponse(404, data={})
+
+    def _search(self, query):
+        album = self.fixture["album"]
+        hits = []
+        match = re.match(r"(Track \d+)", query)
+        if match and match.group(1).lower() in self._by_title:
+            hits.append({"index": "song", "result": self._by_title[match.group(1).lower()]})
+        hits.append({"index": "album", "result": dict(album)})
+        hits.append({"index": "artist", "result": album["artist"]})
+        return {"sections": [{"type": "top_hit", "hits": hits}]}
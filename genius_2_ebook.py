@@ -16,9 +16,32 @@ Requirements:
 import os
 import sys
 import argparse
+import atexit
+import base64
+import csv
 import re
+import json
+import multiprocessing
+import gzip
+import hashlib
+import io
+import random
+import shutil
+import subprocess
+import sqlite3
+import threading
+import time
+import queue
+import zipfile
+import zlib
+from email.utils import parsedate_to_datetime
 import requests
+from requests.exceptions import HTTPError, Timeout, ConnectionError as RequestsConnectionError
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
+from types import SimpleNamespace
 # import lyricsgenius as lg
 from ebooklib import epub
 from ebooklib.plugins.booktype import BooktypeFootnotes
@@ -26,61 +49,768 @@ from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
 import html
-from typing import List, Tuple, Dict, Optional
+from typing import List, Dict, Optional
 
-from unidecode import unidecode
+from normalization import normalizer
+
+try:
+    # Optional: without Pillow images are embedded as downloaded
+    from PIL import Image
+except ImportError:
+    Image = None
 from lyricsgenius.genius import Genius as GeniusOriginal
+from lyricsgenius.api.base import get_description
+from lyricsgenius.types import Album, Song, Track
+
+
+class ResponseCache:
+    """On-disk cache for Genius responses backed by a single SQLite file.
+
+    Entries expire after a per-endpoint TTL and the least recently used ones are
+    evicted once the cache grows past ``max_bytes``.
+    """
+
+    # TTLs in seconds, keyed by endpoint (see _endpoint_for)
+    DEFAULT_TTLS = {
+        "search": 24 * 3600,
+        "albums": 7 * 24 * 3600,
+        "songs": 7 * 24 * 3600,
+        "artists": 7 * 24 * 3600,
+        "referents": 24 * 3600,
+        "lyrics": 7 * 24 * 3600,
+    }
+    DEFAULT_TTL = 24 * 3600
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, ttls=None, refresh=False):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "responses.sqlite3")
+        self.max_bytes = max_bytes
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        # In refresh mode responses are re-fetched but still written back
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(path, params, public_api, web):
+        root = "web" if web else ("public" if public_api else "api")
+        return f"{root}:{path}?{json.dumps(params or {}, sort_keys=True, default=str)}"
+
+    def get(self, key, endpoint):
+        if self.refresh:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or time.time() - row[1] > self.ttls.get(endpoint, self.DEFAULT_TTL):
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key, endpoint, value):
+        blob = zlib.compress(json.dumps(value).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, endpoint, blob, len(blob), now, now))
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RateLimiter:
+    """Token bucket shared by all outgoing requests, with jittered exponential backoff.
+
+    The rate adapts to the server: it is halved whenever a request gets throttled
+    (HTTP 429) and grows back towards ``max_rate`` with every successful request.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_rate=10.0, burst=10, max_retries=3, backoff_base=0.5, backoff_max=60.0):
+        self.max_rate = max_rate
+        self.min_rate = max_rate / 20
+        self.rate = max_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = {"requests": 0, "retries": 0, "throttled": 0, "wait_seconds": 0.0}
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, max_rate=None, max_retries=None):
+        with self._lock:
+            if max_rate is not None:
+                self.max_rate = self.rate = max_rate
+                self.min_rate = max_rate / 20
+            if max_retries is not None:
+                self.max_retries = max_retries
+
+    def acquire(self):
+        """Take a token, sleeping until one is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens may go negative: that reserves a slot for this caller in the queue
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        self._wait(wait)
+
+    def _wait(self, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.metrics["wait_seconds"] += seconds
+        time.sleep(seconds)
+
+    def _backoff_delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(max(delay, 0.0), self.backoff_max)
+                except (TypeError, ValueError):
+                    pass
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _throttled(self):
+        with self._lock:
+            self.metrics["throttled"] += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def _succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def request(self, method, url, session=None, **kwargs):
+        """Send a request through the limiter, retrying throttled, failed and timed out calls.
+
+        Returns the last response once it is not retryable or retries run out;
+        network errors are re-raised after the last attempt.
+        """
+        session = session or requests
+        attempt = 0
+        while True:
+            self.acquire()
+            with self._lock:
+                self.metrics["requests"] += 1
+            response = None
+            try:
+                response = session.request(method, url, **kwargs)
+            except (Timeout, RequestsConnectionError):
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code == 429:
+                    self._throttled()
+                if response.status_code not in self.RETRY_STATUSES:
+                    self._succeeded()
+                    return response
+                if attempt >= self.max_retries:
+                    return response
+
+            delay = self._backoff_delay(attempt, response)
+            attempt += 1
+            with self._lock:
+                self.metrics["retries"] += 1
+            self._wait(delay)
+
+    def summary(self):
+        m = self.metrics
+        return (f"HTTP: {m['requests']} requests, {m['retries']} retries, "
+                f"{m['throttled']} throttled, {m['wait_seconds']:.1f}s waiting")
+
+
+# Shared by every Genius client and the cover downloads
+rate_limiter = RateLimiter()
+
+
+class Profiler:
+    """Stage timings and per-endpoint HTTP counters, collected only when enabled.
+
+    Stages are recorded as Chrome trace events, so the profile written by
+    ``write`` opens directly in chrome://tracing or Perfetto.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.endpoints = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            event = {"name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                     "ts": round((start - self._origin) * 1e6), "dur": round((end - start) * 1e6),
+                     "args": args}
+            with self._lock:
+                self.events.append(event)
+
+    def record(self, events):
+        """Add stage events collected by another process, see _render_chapter_job."""
+        with self._lock:
+            self.events.extend(events)
+
+    def count_request(self, endpoint, size=0, cache_hit=False):
+        if not self.enabled:
+            return
+        with self._lock:
+            counters = self.endpoints.setdefault(endpoint, {"requests": 0, "bytes": 0, "cache_hits": 0})
+            if cache_hit:
+                counters["cache_hits"] += 1
+            else:
+                counters["requests"] += 1
+                counters["bytes"] += size
+
+    def stage_totals(self):
+        totals = {}
+        for event in self.events:
+            count, seconds = totals.get(event["name"], (0, 0.0))
+            totals[event["name"]] = (count + 1, seconds + event["dur"] / 1e6)
+        return totals
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms",
+                       "endpoints": self.endpoints,
+                       "stages": {name: {"count": count, "seconds": round(seconds, 4)}
+                                  for name, (count, seconds) in self.stage_totals().items()}},
+                      f, indent=1)
+
+    def summary(self):
+        lines = ["Stage timings (summed over threads and render processes):"]
+        for name, (count, seconds) in sorted(self.stage_totals().items(), key=lambda x: -x[1][1]):
+            lines.append(f"  {name}: {count}x, {seconds:.2f}s")
+        lines.append("HTTP by endpoint:")
+        for endpoint, c in sorted(self.endpoints.items()):
+            lines.append(f"  {endpoint}: {c['requests']} requests, {c['bytes']} bytes, {c['cache_hits']} cache hits")
+        return "\n".join(lines)
+
+
+# Enabled by --debug
+profiler = Profiler()
+
+
+class AssetPipeline:
+    """Downloads, downsizes and caches book images on a shared thread pool.
+
+    Images are requested as soon as their URL is known (``submit``) and picked
+    up when the book needs them (``get``), so covers and song art download
+    while tracks are still being fetched. Processed images are cached on disk
+    by a hash of their URL and target size.
+    """
+
+    def __init__(self, cache_dir=None, max_size=(1072, 1448), quality=80, workers=4,
+                 timeout=(5, 20), song_art=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.quality = quality
+        self.timeout = timeout
+        # Also embed each song's art in its chapter
+        self.song_art = song_art
+        # Only serve preloaded images, set when rendering bundles without the network
+        self.offline = False
+        self.workers = workers
+        self._executor = None
+        self._session = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def configure(self, cache_dir=None, max_size=None, song_art=None, offline=None):
+        self.cache_dir = cache_dir
+        if max_size is not None:
+            self.max_size = max_size
+        if song_art is not None:
+            self.song_art = song_art
+        if offline is not None:
+            self.offline = offline
+
+    def submit(self, url):
+        """Start fetching the image in the background; returns its future."""
+        with self._lock:
+            if url not in self._futures and self.offline:
+                future = Future()
+                future.set_exception(ConnectionError(f"{url} was not bundled and downloads are disabled"))
+                return future
+            if url not in self._futures:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers)
+                    self._session = requests.Session()
+                    self._session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=self.workers))
+                self._futures[url] = self._executor.submit(self._load, url)
+            return self._futures[url]
+
+    def preload(self, url, data):
+        """Serve already processed image bytes for the URL without downloading it."""
+        future = Future()
+        future.set_result(data)
+        with self._lock:
+            self._futures[url] = future
+
+    def get(self, url):
+        """Return the processed image bytes, raising if the download failed."""
+        return self.submit(url).result()
+
+    def _cache_path(self, url):
+        key = hashlib.sha256(f"{url}|{self.max_size}|{self.quality}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "assets", f"{key}.img")
+
+    def _load(self, url):
+        path = self._cache_path(url) if self.cache_dir else None
+        if path and os.path.exists(path):
+            profiler.count_request("image", cache_hit=True)
+            with open(path, "rb") as f:
+                return f.read()
+
+        with profiler.stage("image download", url=url):
+            response = rate_limiter.request("GET", url, session=self._session, timeout=self.timeout)
+        profiler.count_request("image", len(response.content))
+        if response.status_code != 200:
+            raise ConnectionError(f"HTTP status {response.status_code}")
+        data = self._process(response.content)
+
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+        return data
+
+    def _process(self, data):
+        """Downscale to fit the e-reader screen and recompress as JPEG."""
+        if Image is None:
+            return data
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.thumbnail(self.max_size)
+                out = io.BytesIO()
+                image.convert("RGB").save(out, "JPEG", quality=self.quality, optimize=True)
+        except Exception:
+            # not an image Pillow can read or will open (decompression bombs), embed it untouched
+            return data
+        return out.getvalue() if out.tell() < len(data) else data
+
+
+# Shared by every book built in the process
+assets = AssetPipeline()
+
+
+class FetchJournal:
+    """Append-only JSON lines journal of fetched tracks, one file per album.
+
+    Every track is written as soon as its lyrics and annotations arrive, so a
+    resumed run only fetches the tracks that are not in the journal yet.
+    """
+
+    def __init__(self, journal_dir, album_id, resume=False, prefix="album"):
+        os.makedirs(journal_dir, exist_ok=True)
+        self.path = os.path.join(journal_dir, f"{prefix}_{album_id}.jsonl")
+        self.entries = {}
+        if resume and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line may be cut off if the previous run was killed mid-write
+                        continue
+                    self.entries[entry["key"]] = entry
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+
+    def restore(self, key, track, client):
+        """Fill the track from the journal; returns False if it was not journaled yet."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        track.song = Song(client, entry["song"], entry["song"].get("lyrics", ""))
+        if entry["annotations"] is not None:
+            track.annotations = [Referent.from_json(referent) for referent in entry["annotations"]]
+        return True
+
+    def record(self, key, track):
+        annotations = getattr(track, "annotations", None)
+        if annotations is not None:
+            annotations = [referent.to_json() for referent in annotations]
+        entry = {"key": key, "song": track.song.to_dict(), "annotations": annotations}
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.entries[key] = entry
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Annotation:
+    """One annotation on a referent; only the body the chapters render is kept."""
+    __slots__ = ("body",)
+
+    def __init__(self, body):
+        self.body = body
+
+    def __repr__(self):
+        return f"Annotation({self.body!r})"
+
+
+class Referent:
+    """A fragment of the lyrics with the annotations written for it."""
+    __slots__ = ("fragment", "annotations")
+
+    def __init__(self, fragment, annotations=()):
+        self.fragment = fragment
+        self.annotations = annotations
+
+    def __repr__(self):
+        return f"Referent({self.fragment!r}, {self.annotations!r})"
+
+    @classmethod
+    def from_api(cls, referent):
+        """Build the record from a referent as returned by the API."""
+        annotations = tuple(Annotation(next(iter(a["body"].values()), None)) for a in referent["annotations"])
+        return cls(referent["fragment"], annotations)
+
+    def to_json(self):
+        return [self.fragment, [annotation.body for annotation in self.annotations]]
+
+    @classmethod
+    def from_json(cls, data):
+        fragment, bodies = data
+        # journals written before these records existed kept every body format in a list
+        return cls(fragment, tuple(Annotation(body[0] if isinstance(body, list) and body else body)
+                                   for body in bodies))
+
+
+def _endpoint_for(path, web):
+    """Map a request path to the endpoint name used for cache TTLs."""
+    if web:
+        return "lyrics"
+    return path.strip("/").split("/", 1)[0]
 
 
 # Don't change the name of the class
 # there is a bug in PublicAPI class there that prevents Genius class inheritance - doesn't set headers properly
 # the code part that is buggy -> public_api_constructor = False if self.__class__.__name__ == 'Genius' else True
 class Genius(GeniusOriginal):
+    def __init__(self, *args, cache=None, limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.limiter = limiter or rate_limiter
+
+    # every API, public API and lyrics page request goes through here
+    def _make_request(self, path, method='GET', params_=None, public_api=False, web=False, **kwargs):
+        if self.cache is None or method != 'GET':
+            return self._send(path, method, params_, public_api, web, **kwargs)
+
+        key = self.cache.make_key(path, params_, public_api, web)
+        endpoint = _endpoint_for(path, web)
+        response = self.cache.get(key, endpoint)
+        if response is not None:
+            profiler.count_request(endpoint, cache_hit=True)
+            return response
+
+        response = self._send(path, method, params_, public_api, web, **kwargs)
+        self.cache.set(key, endpoint, response)
+        return response
+
+    # Same as Sender._make_request, but pacing and retries are left to the shared limiter
+    # instead of a fixed sleep_time and retry count
+    def _send(self, path, method='GET', params_=None, public_api=False, web=False, **kwargs):
+        if public_api:
+            uri = self.PUBLIC_API_ROOT
+            header = None
+        elif web:
+            uri = self.WEB_ROOT
+            header = None
+        else:
+            uri = self.API_ROOT
+            header = self.authorization_header
+        uri += path
+
+        endpoint = _endpoint_for(path, web)
+        with profiler.stage(f"http {endpoint}", path=path):
+            response = self.limiter.request(method, uri, session=self._session, timeout=self.timeout,
+                                            params=params_ or {}, headers=header, **kwargs)
+        profiler.count_request(endpoint, len(response.content))
+        try:
+            response.raise_for_status()
+        except HTTPError as e:
+            raise HTTPError(response.status_code, get_description(e)) from e
+
+        if web:
+            return response.text
+        elif response.status_code == 200:
+            res = response.json()
+            return res.get("response", res)
+        elif response.status_code == 204:
+            return 204
+        else:
+            raise AssertionError("Response status code was neither 200, nor 204! "
+                                 "It was {}".format(response.status_code))
+
+    # override search_album
+    # lyricsgenius scrapes every track's lyrics one after another while building the album;
+    # with fetch_lyrics=False only the track list is fetched and the lyrics are left to
+    # fetch_track_data, which runs on the worker pool
+    def search_album(self, name=None, artist="", album_id=None, get_full_info=True,
+                     text_format=None, fetch_lyrics=True):
+        if fetch_lyrics:
+            return super().search_album(name, artist, album_id, get_full_info, text_format)
+
+        msg = "You must pass either a `name` or an `album_id`."
+        assert any([name, album_id]), msg
+
+        if self.verbose and name:
+            print('Searching for "{s}" by {a}...'.format(s=name, a=artist) if artist
+                  else 'Searching for "{s}"...'.format(s=name))
+
+        if album_id:
+            album_info = self.album(album_id, text_format)['album']
+        else:
+            search_term = "{s} {a}".format(s=name, a=artist).strip()
+            response = self.search_all(search_term)
+            album_info = self._get_item_from_search_response(response, name,
+                                                             type_="album",
+                                                             result_type="name")
+        if album_info is None:
+            if self.verbose and name:
+                print("No results found for: '{s}'".format(s=search_term))
+            return None
+
+        if album_id is None and get_full_info:
+            album_info.update(self.album(album_info['id'], text_format)['album'])
+
+        tracks = []
+        next_page = 1
+        while next_page:
+            tracks_list = self.album_tracks(album_id=album_info['id'], per_page=50,
+                                            page=next_page, text_format=text_format)
+            tracks.extend(Track(self, track, "") for track in tracks_list['tracks'])
+            next_page = tracks_list['next_page']
+        return Album(self, album_info, tracks)
+
+    def artist_album_list(self, artist_id):
+        """Return the info of every album of the artist, following the pages."""
+        albums = []
+        next_page = 1
+        while next_page:
+            response = self.artist_albums(artist_id, per_page=50, page=next_page)
+            albums.extend(response['albums'])
+            next_page = response.get('next_page')
+        return albums
+
+    def song_lyrics(self, song):
+        """Scrape the song's lyrics page directly by its URL, without searching."""
+        if song.lyrics_state != 'complete' or song._body.get('instrumental'):
+            return ""
+        return self.lyrics(song_url=song.url) or ""
+
     # override song_annotations
-    # This     def song_annotations(self, song_id, text_format=None): should also take page arg and get next page untile it is done, als maybe per page should be larger
+    # lyricsgenius only returns the first page of referents
     #  known issue https://github.com/johnwmillr/LyricsGenius/issues/245
-    def song_annotations(self, song_id, text_format=None):
-        page_num = 1
-        all_annotations = []  # list of tuples(fragment, annotations[])
-        
-        while True:
-            reponse = self.referents(song_id=song_id,
-                text_format=text_format, page=page_num)
+    REFERENTS_PER_PAGE = 50  # the largest page the API serves
 
-            referents = reponse.get('referents', [])
-            
-            if not referents:
-                break
+    def song_annotations(self, song_id, text_format=None, prefetch=3):
+        """Yield a Referent record for every referent of the song.
+
+        Pages are requested at the maximum size and a page that is not full is
+        the last one, so a song with a single page costs a single request. Once
+        the first page turns out to be full, up to ``prefetch`` following pages
+        are kept in flight concurrently. Referents are yielded page by page as
+        soon as each page arrives. Each page is reduced to records as soon as it
+        is received, so the rest of the response is not kept around.
+        """
+        per_page = self.REFERENTS_PER_PAGE
+
+        def fetch_page(page_num):
+            with profiler.stage("song_annotations page", song_id=song_id, page=page_num):
+                response = self.referents(song_id=song_id, text_format=text_format,
+                                          per_page=per_page, page=page_num)
+            return [Referent.from_api(referent) for referent in response.get('referents', [])]
+
+        referents = fetch_page(1)
+        yield from referents
+        if len(referents) < per_page:
+            return
+
+        with ThreadPoolExecutor(max_workers=prefetch) as executor:
+            in_flight = deque(executor.submit(fetch_page, page_num) for page_num in range(2, 2 + prefetch))
+            next_page = 2 + prefetch
+            while in_flight:
+                referents = in_flight.popleft().result()
+                yield from referents
+                if len(referents) < per_page:
+                    # pages past the last one are empty, drop whatever is still queued
+                    for future in in_flight:
+                        future.cancel()
+                    break
+                in_flight.append(executor.submit(fetch_page, next_page))
+                next_page += 1
+
+# Markup shared by every chapter, built once per process
+CHAPTER_HEAD = """
+        <html>
+        <head>
+            <title>{title}</title>
+        </head>
+        <body>
+            <h1>{number}. {title}</h1>
+        """
+CHAPTER_ART = """<p class="song-art"><img src="{src}" alt="{title}"/></p>"""
+CHAPTER_LYRICS = """
+            <div class="lyrics">
+                <pre>{lyrics}</pre>
+            </div>
+        """
+CHAPTER_TAIL = """
+        </body>
+        </html>
+        """
+FOOTNOTE_TEMPLATE = """<li id="InsertNoteID_{id}">{note}<span id="InsertNoteID_{id}_LinkBacks"><sup><a href="#InsertNoteID_{id}_marker1">↩</a></sup></span></li>"""
+MARKER_TEMPLATE = """<span id="InsertNoteID_{id}_marker1" class="InsertNoteMarker"><sup><a href="#InsertNoteID_{id}">➜</a></sup></span>"""
+
+STYLE = """
+    @namespace epub "http://www.idpf.org/2007/ops";
+    body {
+        font-family: Cambria, Liberation Serif, Bitstream Vera Serif, Georgia, Times, Times New Roman, serif;
+        margin: 5%;
+        text-align: justify;
+    }
+    h1 {
+        text-align: center;
+        page-break-before: always;
+    }
+    h2 {
+        text-align: center;
+        margin-top: 1em;
+    }
+    h3 {
+        margin-top: 1.5em;
+        background-color: #f5f5f5;
+        padding: 5px;
+    }
+    pre {
+        font-family: inherit;
+        white-space: pre-wrap;
+        margin: 1em 0;
+        line-height: 1.5;
+    }
+
+    .annotations {
+        margin-top: 2em;
+        border-top: 1px solid #ccc;
+        padding-top: 1em;
+    }
+    .annotation {
+        margin-bottom: 1.5em;
+        padding-bottom: 1em;
+        border-bottom: 1px dotted #ddd;
+    }
+    """
 
-            for r in referents:
-                fragment = r["fragment"]
-                annotations = []
-                for a in r["annotations"]:
-                    annotations.append([x for x in a["body"].values()])
-                all_annotations.append((fragment, annotations))
-            page_num += 1
-        return all_annotations
 
 class LyricsAnnotator:
-    def __init__(self, annotations: List[Tuple[str, List[str]]], full_lyrics: str):
+    def __init__(self, annotations: List[Referent], full_lyrics: str):
         self.annotations = annotations
         self.full_lyrics = full_lyrics
         self.footnotes = '<ol id="InsertNote_NoteList">'
         self.current_id = 1
         
     def annotate_lyrics(self) -> str:
-        for annotation in self.annotations:
-            fragment = unidecode(annotation[0]) if annotation[0] else None
-            note = annotation[1][0][0]
-            
-            if not fragment or not note or self.full_lyrics.find(fragment) == -1: 
+        # (fragment, note) pairs in annotation order
+        entries = []
+        for referent in self.annotations:
+            fragment = normalizer.normalize(referent.fragment) if referent.fragment else None
+            note = referent.annotations[0].body if referent.annotations else None
+
+            if not fragment or not note:
                 print("Skipping annotation with empty fragment or notes")
                 continue
-            
-            self.full_lyrics = self.full_lyrics.replace(fragment, f"""<strong>{fragment}</strong><span id="InsertNoteID_{self.current_id}_marker1" class="InsertNoteMarker"><sup><a href="#InsertNoteID_{self.current_id}">➜</a></sup></span>""")
-            self.footnotes += f"""<li id="InsertNoteID_{self.current_id}">{note}<span id="InsertNoteID_{self.current_id}_LinkBacks"><sup><a href="#InsertNoteID_{self.current_id}_marker1">↩</a></sup></span></li>"""
-            self.current_id += 1    
-        self.footnotes += '</ol>'
+            entries.append((fragment, note))
+
+        if not entries:
+            self.footnotes += '</ol>'
+            return self.full_lyrics + self.footnotes
+
+        # One scan over the lyrics for all fragments. Longer fragments come first in the
+        # alternation, so where several fragments start at the same position the longest wins
+        # and the shorter ones are not matched inside it.
+        fragments = sorted({fragment for fragment, _ in entries}, key=len, reverse=True)
+        pattern = re.compile("|".join(re.escape(fragment) for fragment in fragments))
+        matches = [(m.start(), m.end(), m.group()) for m in pattern.finditer(self.full_lyrics)]
+        matched = {fragment for _, _, fragment in matches}
+
+        # Number the notes in annotation order, only for fragments found in the lyrics
+        note_ids = {}
+        footnotes = [self.footnotes]
+        for fragment, note in entries:
+            if fragment not in matched:
+                print("Skipping annotation with empty fragment or notes")
+                continue
+            note_ids.setdefault(fragment, []).append(self.current_id)
+            footnotes.append(FOOTNOTE_TEMPLATE.format(id=self.current_id, note=note))
+            self.current_id += 1
+        footnotes.append('</ol>')
+
+        markup = {}
+        for fragment, ids in note_ids.items():
+            markers = "".join(MARKER_TEMPLATE.format(id=note_id) for note_id in ids)
+            markup[fragment] = f"<strong>{fragment}</strong>{markers}"
+
+        parts = []
+        position = 0
+        for start, end, fragment in matches:
+            parts.append(self.full_lyrics[position:start])
+            parts.append(markup[fragment])
+            position = end
+        parts.append(self.full_lyrics[position:])
+
+        self.full_lyrics = "".join(parts)
+        self.footnotes = "".join(footnotes)
         return self.full_lyrics + self.footnotes
 
 def sanitize_filename(filename):
@@ -88,63 +818,149 @@ def sanitize_filename(filename):
     return re.sub(r'[\\/*?:"<>|]', "_", filename)
 
 
-def get_album_data(artist_name, album_name, api_key):
-    """Fetch album data from Genius."""
+def fetch_track_data(genius, track, journal=None):
+    """Fetch lyrics and annotations for a single album track.
+
+    The track's song (and its ID) is already known from the album's track list,
+    so the lyrics page and referents are requested directly instead of searching.
+    """
+    # Journal entries are keyed by the album's track song id, which is known before fetching
+    key = track.song.id
+    if journal is not None and journal.restore(key, track, genius):
+        print(f"Resumed from journal: {track.song.title}")
+        return track
+
+    print(f"Fetching lyrics for: {track.song.title}")
+    song = track.song
+    if assets.song_art and song.song_art_image_url:
+        assets.submit(song.song_art_image_url)
+    with profiler.stage("song_lyrics", title=song.title):
+        song.lyrics = genius.song_lyrics(song)
+    with profiler.stage("song_annotations", song_id=song.id):
+        track.annotations = list(genius.song_annotations(song.id))
+    if journal is not None:
+        journal.record(key, track)
+    return track
+
+
+def fetch_album_tracks(genius, album, workers=1, journal=None):
+    """Fetch every track of the album, optionally on a bounded thread pool.
+
+    Tracks are updated in place, so ``album.tracks`` keeps the album order no
+    matter in which order the lookups finish. Failed tracks are collected in
+    ``album.fetch_errors`` as ``(track_num, title, error)`` tuples.
+    """
+    album.fetch_errors = []
+    pending = [(track_num, track) for track_num, track in enumerate(album.tracks, 1)
+               if hasattr(track, 'song') and track.song]
+
+    if workers <= 1:
+        for track_num, track in pending:
+            try:
+                fetch_track_data(genius, track, journal)
+            except Exception as e:
+                print(f"Error fetching lyrics for {track.song.title}: {e}")
+                album.fetch_errors.append((track_num, track.song.title, str(e)))
+        return album.fetch_errors
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_track_data, genius, track, journal): (track_num, track)
+                   for track_num, track in pending}
+        for future in as_completed(futures):
+            track_num, track = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error fetching lyrics for {track.song.title}: {e}")
+                album.fetch_errors.append((track_num, track.song.title, str(e)))
+
+    album.fetch_errors.sort()
+    return album.fetch_errors
+
+
+def create_genius_client(api_key, cache=None, pool_size=10):
+    """Create a Genius client whose HTTP session can be shared across threads."""
     genius = Genius(api_key, 
                       skip_non_songs=True, 
                       excluded_terms=["(Remix)", "(Live)"],
                       remove_section_headers=False,
                       verbose=True,
                       retries=3,
+                      cache=cache,
                     )
+    # Keep enough pooled connections for every worker sharing the session
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    genius._session.mount("https://", adapter)
+    return genius
+
+
+def find_album(genius, artist_name, album_name):
+    """Search Genius for the album, falling back to the artist's canonical name."""
+    print(f"Searching for album '{album_name}' by '{artist_name}'...")
     
-    try:
-        print(f"Searching for album '{album_name}' by '{artist_name}'...")
+    # Search for the album directly rather than going through artist
+    with profiler.stage("search_album", album=album_name):
+        album = genius.search_album(album_name, artist_name, fetch_lyrics=False)
+    if not album:
+        # Try a more general search approach
+        print("Direct album search failed, trying alternative methods...")
         
-        # Search for the album directly rather than going through artist
-        album = genius.search_album(album_name, artist_name)
-        if not album:
-            # Try a more general search approach
-            print("Direct album search failed, trying alternative methods...")
+        # Try searching for songs by the artist first to verify the artist exists
+        artist_search = genius.search_artist(artist_name, max_songs=1)
+        if not artist_search:
+            print(f"Artist '{artist_name}' not found on Genius.")
+            return None
             
-            # Try searching for songs by the artist first to verify the artist exists
-            artist_search = genius.search_artist(artist_name, max_songs=1)
-            if not artist_search:
-                print(f"Artist '{artist_name}' not found on Genius.")
-                return None
-                
-            # Try direct album search with found artist name (might be slightly different)
-            album = genius.search_album(album_name, artist_search.name)
-            
-            if not album:
-                print(f"Album '{album_name}' not found.")
-                return None
+        # Try direct album search with found artist name (might be slightly different)
+        album = genius.search_album(album_name, artist_search.name, fetch_lyrics=False)
+        
+        if not album:
+            print(f"Album '{album_name}' not found.")
+            return None
+
+    # Start downloading the cover while the tracks are fetched
+    if album.cover_art_url:
+        assets.submit(album.cover_art_url)
+    return album
+
+
+def get_album_data(artist_name, album_name, api_key, workers=1, cache=None, genius=None,
+                   journal_dir=None, resume=False):
+    """Fetch album data from Genius.
+
+    With ``journal_dir`` set, fetched tracks are checkpointed there and ``resume``
+    reuses the tracks journaled by a previous, interrupted run.
+    """
+    if genius is None:
+        genius = create_genius_client(api_key, cache, pool_size=max(workers, 10))
+    
+    try:
+        album = find_album(genius, artist_name, album_name)
+        if not album:
+            return None
         
         # Fetch all tracks with lyrics
         print(f"Found album: {album.name} by {album.artist.name}")
-        print("Fetching track lyrics...")
+        print(f"Fetching track lyrics ({workers} worker{'s' if workers > 1 else ''})...")
         
-        for track in album.tracks:
-            if not hasattr(track, 'song') or not track.song:
-                continue
-                
-            print(f"Fetching lyrics for: {track.song.title}")
-            try:
-                # Fetch the song with lyrics
-                song = genius.search_song(track.song.title, album.artist.name)
-                
-                if song:
-                    # Attach the song object with lyrics to the track
-                    track.song = song
-                    track.annotations = genius.song_annotations(song.id) 
-            except Exception as e:
-                print(f"Error fetching lyrics for {track.song.title}: {e}")
+        journal = FetchJournal(journal_dir, album.id, resume) if journal_dir else None
+        if journal is not None and journal.entries:
+            print(f"Resuming: {len(journal.entries)} tracks already in {journal.path}")
+        try:
+            fetch_errors = fetch_album_tracks(genius, album, workers, journal)
+        finally:
+            if journal is not None:
+                journal.close()
         
         # Count tracks with lyrics
         tracks_with_lyrics = sum(1 for track in album.tracks if hasattr(track, 'song') and 
                                 track.song and hasattr(track.song, 'lyrics') and track.song.lyrics)
         print(f"Number of tracks: {len(album.tracks)}")
         print(f"Tracks with lyrics: {tracks_with_lyrics}")
+        if fetch_errors:
+            print(f"Tracks with errors: {len(fetch_errors)}")
+            for track_num, title, error in fetch_errors:
+                print(f"  {track_num}. {title}: {error}")
         
         return album
     
@@ -153,8 +969,125 @@ def get_album_data(artist_name, album_name, api_key):
         print("Try checking the spelling of the artist and album names.")
         return None
 
-def create_epub(album, output_format="epub"):
-    """Create an ebook from album data."""
+
+def find_discography(genius, artist_name):
+    """Find the artist and every album listed for them, with track lists but no lyrics yet."""
+    print(f"Searching for artist '{artist_name}'...")
+    with profiler.stage("search_artist", artist=artist_name):
+        artist = genius.search_artist(artist_name, max_songs=0)
+    # an Artist without fetched songs is falsy, compare with None
+    if artist is None:
+        print(f"Artist '{artist_name}' not found on Genius.")
+        return None, []
+
+    albums = []
+    for album_info in genius.artist_album_list(artist.id):
+        # one album failing to load does not stop the others
+        try:
+            with profiler.stage("search_album", album=album_info['name']):
+                album = genius.search_album(album_id=album_info['id'], fetch_lyrics=False)
+        except Exception as e:
+            print(f"Skipping {album_info['name']} - error fetching album: {e}")
+            continue
+        if not album:
+            print(f"Skipping {album_info['name']} - album not found")
+            continue
+        if album.cover_art_url:
+            assets.submit(album.cover_art_url)
+        albums.append(album)
+    return artist, albums
+
+
+def fetch_discography_tracks(genius, albums, workers=1, journal=None):
+    """Fetch each song of the albums once, however many albums it appears on.
+
+    Reissues, deluxe editions and compilations share the Song and referents of
+    the first track of the same song. Every album gets its own ``fetch_errors``.
+    Returns the number of unique songs.
+    """
+    first_tracks = {}
+    for album in albums:
+        for track in album.tracks:
+            if hasattr(track, 'song') and track.song:
+                first_tracks.setdefault(track.song.id, track)
+
+    songs = SimpleNamespace(tracks=list(first_tracks.values()))
+    fetch_album_tracks(genius, songs, workers, journal)
+    failed = {songs.tracks[track_num - 1].song.id: error for track_num, _, error in songs.fetch_errors}
+
+    for album in albums:
+        album.fetch_errors = []
+        for track_num, track in enumerate(album.tracks, 1):
+            if not (hasattr(track, 'song') and track.song):
+                continue
+            first = first_tracks[track.song.id]
+            if first is not track:
+                track.song = first.song
+                if hasattr(first, 'annotations'):
+                    track.annotations = first.annotations
+            if track.song.id in failed:
+                album.fetch_errors.append((track_num, track.song.title, failed[track.song.id]))
+    return len(first_tracks)
+
+
+def discography_album(artist, albums):
+    """Combine the albums into one album-like object, each song once, grouped by album."""
+    tracks = []
+    sections = []
+    seen = set()
+    for album in albums:
+        track_nums = []
+        for track in album.tracks:
+            if not (hasattr(track, 'song') and track.song) or track.song.id in seen:
+                continue
+            seen.add(track.song.id)
+            tracks.append(track)
+            track_nums.append(len(tracks))
+        if track_nums:
+            sections.append((album.name, track_nums))
+    return SimpleNamespace(id=f"discography_{artist.id}", name="Discography", artist=artist,
+                           cover_art_url=getattr(artist, 'image_url', None), release_date_components=None,
+                           tracks=tracks, sections=sections)
+
+
+def build_discography(genius, artist_name, output_format="epub", workers=1, journal_dir=None,
+                      resume=False, combined=False, compression=None):
+    """Write one ebook per album of the artist, or a single combined one; returns the outputs."""
+    artist, albums = find_discography(genius, artist_name)
+    if not albums:
+        print(f"No albums found for '{artist_name}'.")
+        return []
+    print(f"Found {len(albums)} albums by {artist.name}")
+
+    journal = FetchJournal(journal_dir, artist.id, resume, prefix="artist") if journal_dir else None
+    try:
+        unique = fetch_discography_tracks(genius, albums, workers, journal)
+    finally:
+        if journal is not None:
+            journal.close()
+    print(f"Fetched {unique} unique songs for {sum(len(album.tracks) for album in albums)} album tracks")
+
+    if combined:
+        if getattr(artist, 'image_url', None):
+            assets.submit(artist.image_url)
+        return [create_epub(discography_album(artist, albums), output_format, compression)]
+
+    outputs = []
+    for album in albums:
+        if not any(getattr(track.song, 'lyrics', None) for track in album.tracks if getattr(track, 'song', None)):
+            print(f"Skipping {album.name} - no lyrics available")
+            continue
+        try:
+            outputs.append(create_epub(album, output_format, compression))
+        except Exception as e:
+            print(f"Error creating ebook for {album.name}: {e}")
+    return outputs
+
+def start_book(album):
+    """Create the book with its metadata, cover and introduction chapter.
+
+    Returns the book and the spine started with the navigation and introduction.
+    """
     # Create a new EPUB book
     book = epub.EpubBook()
     
@@ -167,21 +1100,16 @@ def create_epub(album, output_format="epub"):
     book.add_metadata('DC', 'publisher', 'Generated with Album Lyrics to Ebook Generator')
     book.add_metadata('DC', 'date', datetime.now().strftime("%Y-%m-%d"))
     
-    # Create chapters
-    chapters = []
     spine = ['nav']
 
     # Add cover
     if hasattr(album, 'cover_art_url') and album.cover_art_url:
         try:
-            # Download cover image
-            response = requests.get(album.cover_art_url)
-            if response.status_code == 200:
-                # Create cover image
-                book.set_cover("cover.jpg", response.content)
-                print("Added album cover to ebook")
-            else:
-                print(f"Failed to download cover image: HTTP status {response.status_code}")
+            # Usually already downloaded and downsized by the asset pipeline
+            with profiler.stage("cover download"):
+                cover = assets.get(album.cover_art_url)
+            book.set_cover("cover.jpg", cover)
+            print("Added album cover to ebook")
         except Exception as e:
             print(f"Error adding cover image: {e}")
             print("Continuing without cover image")
@@ -196,7 +1124,7 @@ def create_epub(album, output_format="epub"):
     <body>
         <h1>{album.name}</h1>
         <h2>by {album.artist.name}</h2>
-        <p>Released: {album.release_date_components.strftime("%d %B %Y") if hasattr(album, 'release_date_components') else 'Unknown'} <!-- Annotation: This is a note. --></p>
+        <p>Released: {album.release_date_components.strftime("%d %B %Y") if getattr(album, 'release_date_components', None) else 'Unknown'} <!-- Annotation: This is a note. --></p>
         <p>This ebook contains lyrics and annotations for all songs in this album.</p>
         <p>All content is sourced from Genius.com.</p>
     </body>
@@ -205,171 +1133,1167 @@ def create_epub(album, output_format="epub"):
     intro.content = intro_content
     book.add_item(intro)
     spine.append(intro)
-    # Create a chapter for each song
-    for track_num, track in enumerate(album.tracks, 1):
-        # Skip if no song or no lyrics
-        if not hasattr(track, 'song') or not track.song or not hasattr(track.song, 'lyrics') or not track.song.lyrics:
-            print(f"Skipping track {track_num} - no lyrics available")
-            continue
-        
-        # Create chapter
-        chapter = epub.EpubHtml(title=track.song.title, file_name=f'song_{track_num}.xhtml')
+    return book, spine
 
-        
-        # Build chapter content
-        chapter_content = f"""
-        <html>
-        <head>
-            <title>{track.song.title}</title>
-        </head>
-        <body>
-            <h1>{track_num}. {track.song.title}</h1>
-        """
-        
-        # Add lyrics
-        lyrics = track.song.lyrics if hasattr(track.song, 'lyrics') else ""
-        lyrics_no_header = lyrics.replace('Lyrics', '', 1).strip() # Remove the "Lyrics" header 
-        lyrics_unescaped = lyrics_no_header
-        lyrics_unescaped = lyrics_no_header.replace("\'", "’").replace("\n", "\n ")
-        finall_lyrics = unidecode(lyrics_unescaped) 
 
-        
-        if (hasattr(track, 'annotations')):
-            # Add annotations
-            annotator = LyricsAnnotator(track.annotations, finall_lyrics)
-            finall_lyrics = annotator.annotate_lyrics()
-            
-                
-        lyrics_html = f"""
-            <div class="lyrics">
-                <pre>{finall_lyrics}</pre>
-            </div>
-        """
-        chapter_content += lyrics_html
+def create_chapter(track_num, track):
+    """Build the chapter for one track, or return None if it has no lyrics."""
+    # Skip if no song or no lyrics
+    if not hasattr(track, 'song') or not track.song or not hasattr(track.song, 'lyrics') or not track.song.lyrics:
+        print(f"Skipping track {track_num} - no lyrics available")
+        return None
+    
+    # Create chapter
+    chapter = epub.EpubHtml(title=track.song.title, file_name=f'song_{track_num}.xhtml')
+    # Images the chapter refers to, the caller adds them to the book
+    chapter.images = []
 
-        chapter_content += """
-        </body>
-        </html>
-        """
-        
-        chapter.content = chapter_content
-        book.add_item(chapter)
-        chapters.append(chapter)
-        spine.append(chapter)
     
-    # Add default CSS
-    style = """
-    @namespace epub "http://www.idpf.org/2007/ops";
-    body {
-        font-family: Cambria, Liberation Serif, Bitstream Vera Serif, Georgia, Times, Times New Roman, serif;
-        margin: 5%;
-        text-align: justify;
-    }
-    h1 {
-        text-align: center;
-        page-break-before: always;
-    }
-    h2 {
-        text-align: center;
-        margin-top: 1em;
-    }
-    h3 {
-        margin-top: 1.5em;
-        background-color: #f5f5f5;
-        padding: 5px;
-    }
-    pre {
-        font-family: inherit;
-        white-space: pre-wrap;
-        margin: 1em 0;
-        line-height: 1.5;
-    }
+    # Build chapter content
+    parts = [CHAPTER_HEAD.format(title=track.song.title, number=track_num)]
 
-    .annotations {
-        margin-top: 2em;
-        border-top: 1px solid #ccc;
-        padding-top: 1em;
-    }
-    .annotation {
-        margin-bottom: 1.5em;
-        padding-bottom: 1em;
-        border-bottom: 1px dotted #ddd;
-    }
+    art_url = getattr(track.song, 'song_art_image_url', None)
+    if assets.song_art and art_url:
+        try:
+            art = epub.EpubImage(uid=f"song_art_{track_num}", file_name=f"images/song_{track_num}.jpg",
+                                 media_type="image/jpeg", content=assets.get(art_url))
+            chapter.images.append(art)
+            parts.append(CHAPTER_ART.format(src=art.file_name, title=track.song.title))
+        except Exception as e:
+            print(f"Error adding song art for {track.song.title}: {e}")
+    
+    # Add lyrics
+    lyrics = track.song.lyrics if hasattr(track.song, 'lyrics') else ""
+    lyrics_no_header = lyrics.replace('Lyrics', '', 1).strip() # Remove the "Lyrics" header 
+    finall_lyrics = normalizer.normalize_lyrics(lyrics_no_header)
+
+    
+    if (hasattr(track, 'annotations')):
+        # Add annotations
+        annotator = LyricsAnnotator(track.annotations, finall_lyrics)
+        with profiler.stage("annotate", track=track_num):
+            finall_lyrics = annotator.annotate_lyrics()
+        
+    parts.append(CHAPTER_LYRICS.format(lyrics=finall_lyrics))
+    parts.append(CHAPTER_TAIL)
+
+    chapter.content = "".join(parts)
+    return chapter
+
+
+def finish_book(book, chapters, spine, sections=None):
+    """Add the stylesheet and navigation once all chapters are known.
+
+    ``sections`` optionally groups the table of contents as (title, track numbers) pairs.
     """
+    # Add default CSS
     
     css = epub.EpubItem(uid="style_default", file_name="style/default.css", 
-                        media_type="text/css", content=style)
+                        media_type="text/css", content=STYLE)
     book.add_item(css)
     
     # Add navigation files
     book.toc = chapters
+    if sections:
+        by_name = {chapter.file_name: chapter for chapter in chapters}
+        book.toc = []
+        for title, track_nums in sections:
+            section_chapters = [by_name[f'song_{n}.xhtml'] for n in track_nums if f'song_{n}.xhtml' in by_name]
+            if section_chapters:
+                book.toc.append((epub.Section(title, section_chapters[0].file_name), section_chapters))
     book.spine = spine
     book.add_item(epub.EpubNcx())
     book.add_item(epub.EpubNav())
-    
+
+
+def _render_chapter_job(track_num, title, lyrics, annotations, art, keep_unicode, profile_origin=None):
+    # Runs in a renderer process: annotate, build and serialize one chapter.
+    # With --debug the stage events go back with the result, timed against the
+    # parent's origin so they line up in its trace.
+    normalizer.configure(keep_unicode=keep_unicode)
+    profiler.enabled = profile_origin is not None
+    profiler.events = []
+    if profiler.enabled:
+        profiler._origin = profile_origin
+    assets.configure(song_art=art is not None)
+    if art is not None:
+        assets.preload(*art)
+    track = SimpleNamespace(song=SimpleNamespace(title=title, lyrics=lyrics,
+                                                 song_art_image_url=art[0] if art else None))
+    if annotations is not None:
+        track.annotations = annotations
+    chapter = create_chapter(track_num, track)
+    if chapter is None:
+        return None, profiler.events
+    # get_content only needs the book for its template and language, see start_book
+    chapter.book = epub.EpubBook()
+    chapter.book.set_language('en')
+    return (chapter.file_name, chapter.get_content(), [(image.file_name, image.content) for image in chapter.images]), \
+        profiler.events
+
+
+class ChapterRenderer:
+    """Pool of processes annotating and serializing chapters on every core.
+
+    Disabled with a single worker, in which case chapters are rendered in the
+    calling thread as before. ``submit`` returns a future giving the chapter and
+    its serialized content, ready for ``StreamingEpubWriter.write_chapter``.
+    """
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_workers > 1
+
+    def configure(self, max_workers):
+        self.max_workers = max_workers
+
+    def submit(self, track_num, track):
+        result = Future()
+        song = getattr(track, 'song', None)
+        if not song or not getattr(song, 'lyrics', None):
+            # reports the skipped track, nothing to render
+            result.set_result((create_chapter(track_num, track), None))
+            return result
+
+        art = None
+        if assets.song_art and song.song_art_image_url:
+            try:
+                art = (song.song_art_image_url, assets.get(song.song_art_image_url))
+            except Exception as e:
+                print(f"Error adding song art for {song.title}: {e}")
+
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking would copy the fetch threads' locks mid-use
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            job = self._executor.submit(_render_chapter_job, track_num, song.title, song.lyrics,
+                                        getattr(track, 'annotations', None), art, normalizer.keep_unicode,
+                                        profiler._origin if profiler.enabled else None)
+
+        def done(job):
+            try:
+                rendered, events = job.result()
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            profiler.record(events)
+            if rendered is None:
+                result.set_result((None, None))
+                return
+            file_name, content, images = rendered
+            chapter = epub.EpubHtml(title=song.title, file_name=file_name)
+            chapter.images = [epub.EpubImage(uid=f"song_art_{track_num}", file_name=image_name,
+                                             media_type="image/jpeg", content=data)
+                              for image_name, data in images]
+            result.set_result((chapter, content))
+
+        job.add_done_callback(done)
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+# Configured by --render-workers
+chapter_renderer = ChapterRenderer()
+atexit.register(chapter_renderer.close)
+
+
+def book_filename_base(album):
+    return sanitize_filename(f"{album.artist.name} - {album.name}")
+
+
+# Runs inside Calibre's own Python (calibre-debug -c) and converts one book per
+# JSON line read from stdin, so Calibre's startup cost is paid once per process.
+# The replies go out on a duplicate of the original stdout, and fd 1 is pointed
+# at stderr before Calibre is imported, since its logger binds stdout on import.
+_CALIBRE_WORKER = r"""
+import json, os, sys
+protocol = os.fdopen(os.dup(1), 'w')
+os.dup2(2, 1)
+sys.stdout = sys.stderr
+from calibre.ebooks.conversion.cli import main as ebook_convert
+for line in sys.stdin:
+    job = json.loads(line)
+    try:
+        code = ebook_convert(['ebook-convert', job['input'], job['output']])
+    except SystemExit as e:
+        code = e.code
+    except Exception as e:
+        code = repr(e)
+    error = None if not code else (code if isinstance(code, str) else 'ebook-convert exited with %s' % code)
+    protocol.write(json.dumps({'ok': error is None, 'error': error}) + '\n')
+    protocol.flush()
+"""
+
+
+class ConversionError(Exception):
+    pass
+
+
+class Azw3Converter:
+    """Pool of long-lived Calibre worker processes converting EPUB to AZW3.
+
+    Workers are started on first use and reused for every following book, up to
+    ``max_workers`` conversions run in parallel. Without ``calibre-debug`` on the
+    PATH each conversion falls back to a one-off ``ebook-convert`` run.
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._processes = []
+        self._lock = threading.Lock()
+        self._persistent = None
+
+    def _start_worker(self):
+        process = subprocess.Popen(["calibre-debug", "-c", _CALIBRE_WORKER],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        with self._lock:
+            self._processes.append(process)
+        return process
+
+    def _discard(self, process):
+        process.kill()
+        with self._lock:
+            if process in self._processes:
+                self._processes.remove(process)
+
+    def _take_worker(self):
+        while True:
+            try:
+                process = self._idle.get_nowait()
+            except queue.Empty:
+                return self._start_worker()
+            if process.poll() is None and not process.stdin.closed:
+                return process
+            # exited or closed since its last book
+            self._discard(process)
+
+    def _convert_with_worker(self, epub_path, azw3_path):
+        process = self._take_worker()
+        try:
+            process.stdin.write(json.dumps({"input": epub_path, "output": azw3_path}) + "\n")
+            process.stdin.flush()
+            reply = process.stdout.readline()
+        except (OSError, ValueError) as e:
+            # ValueError: the pipe was closed under us
+            self._discard(process)
+            raise ConversionError(f"Calibre worker died: {e}") from e
+        if not reply:
+            self._discard(process)
+            raise ConversionError(f"Calibre worker exited with {process.wait()}")
+        try:
+            result = json.loads(reply)
+            ok = result["ok"]
+        except (ValueError, TypeError, KeyError):
+            # out of sync with the worker, its next reply could belong to this job
+            self._discard(process)
+            raise ConversionError(f"Unexpected reply from Calibre worker: {reply.strip()[:200]}")
+        self._idle.put(process)
+        if not ok:
+            raise ConversionError(result["error"])
+
+    def convert(self, epub_path, azw3_path):
+        """Convert one book, raising ConversionError if Calibre fails."""
+        if self._persistent is None:
+            self._persistent = shutil.which("calibre-debug") is not None
+        with self._slots:
+            if self._persistent:
+                self._convert_with_worker(epub_path, azw3_path)
+            else:
+                result = subprocess.run(["ebook-convert", epub_path, azw3_path],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+                if result.returncode != 0:
+                    raise ConversionError(result.stderr.strip().splitlines()[-1] if result.stderr.strip()
+                                          else f"ebook-convert exited with {result.returncode}")
+        if not os.path.exists(azw3_path):
+            raise ConversionError(f"{azw3_path} was not created")
+
+    def configure(self, max_workers):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+    def close(self):
+        """Stop every worker; the next conversion starts fresh ones."""
+        with self._lock:
+            processes, self._processes = self._processes, []
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for process in processes:
+            try:
+                process.stdin.close()
+                process.wait(timeout=10)
+            except Exception:
+                process.kill()
+
+
+# Shared by every AZW3 build in the process
+azw3_converter = Azw3Converter()
+atexit.register(azw3_converter.close)
+
+
+def convert_to_azw3(epub_path, filename_base, keep_epub=False):
+    """Convert the EPUB with Calibre, keeping the EPUB if the conversion fails."""
+    azw3_path = f"{filename_base}.azw3"
+    try:
+        with profiler.stage("convert azw3"):
+            azw3_converter.convert(epub_path, azw3_path)
+    except (ConversionError, OSError) as e:
+        print(f"Error converting to AZW3: {e}")
+        print("Keeping EPUB format instead.")
+        return epub_path
+    # Remove temporary EPUB
+    if not keep_epub:
+        os.remove(epub_path)
+    return azw3_path
+
+
+def create_epub(album, output_format="epub", compression=None):
+    """Create an ebook from album data.
+
+    ``compression`` is one of EPUB_COMPRESSION; by default the EPUB is stored
+    uncompressed when it is only converted to AZW3.
+    """
+    book, spine = start_book(album)
+
     # Create output filename
-    filename_base = sanitize_filename(f"{album.artist.name} - {album.name}")
+    filename_base = book_filename_base(album)
+    compression = epub_compression(output_format, compression)
+
+    if chapter_renderer.enabled and output_format.lower() in ("epub", "azw3"):
+        epub_path = f"{filename_base}.epub"
+        start = time.perf_counter()
+        with profiler.stage("write_epub", compression=compression):
+            write_epub_rendered(album, book, spine, epub_path, compression)
+        report_epub_write(epub_path, compression, time.perf_counter() - start)
+        if output_format.lower() == "azw3":
+            return convert_to_azw3(epub_path, filename_base)
+        return epub_path
+
+    # Create a chapter for each song
+    chapters = []
+    for track_num, track in enumerate(album.tracks, 1):
+        chapter = create_chapter(track_num, track)
+        if chapter is None:
+            continue
+        book.add_item(chapter)
+        for image in chapter.images:
+            book.add_item(image)
+        chapters.append(chapter)
+        spine.append(chapter)
+    
+    finish_book(book, chapters, spine, getattr(album, 'sections', None))
     
     # Save the ebook
     if output_format.lower() == "epub":
         epub_path = f"{filename_base}.epub"
-        epub.write_epub(epub_path, book)
+        write_epub(epub_path, book, compression)
         return epub_path
     elif output_format.lower() == "azw3":
         # First save as EPUB
         epub_path = f"{filename_base}.epub"
-        epub.write_epub(epub_path, book)
+        write_epub(epub_path, book, compression)
         
         # Then convert to AZW3 using Calibre's ebook-convert if available
-        try:
-            azw3_path = f"{filename_base}.azw3"
-            os.system(f'ebook-convert "{epub_path}" "{azw3_path}"')
-            # Remove temporary EPUB
-            os.remove(epub_path)
-            return azw3_path
-        except Exception as e:
-            print(f"Error converting to AZW3: {e}")
-            print("Keeping EPUB format instead.")
-            return epub_path
+        return convert_to_azw3(epub_path, filename_base)
     else:
         print(f"Unsupported format: {output_format}. Using EPUB instead.")
         epub_path = f"{filename_base}.epub"
-        epub.write_epub(epub_path, book, { "plugins" : [BooktypeFootnotes(booktype_book=book)] })
+        write_epub(epub_path, book, compression, { "plugins" : [BooktypeFootnotes(booktype_book=book)] })
         return epub_path
 
-def main():
-    load_dotenv() 
-    parser = argparse.ArgumentParser(description="Generate an ebook of album lyrics and annotations")
-    parser.add_argument("artist", help="Artist name")
-    parser.add_argument("album", help="Album name")
+
+def write_epub_rendered(album, book, spine, epub_path, compression="default"):
+    """Render every chapter on the chapter renderer and write them in album order."""
+    jobs = [(track_num, track, chapter_renderer.submit(track_num, track))
+            for track_num, track in enumerate(album.tracks, 1)]
+    writer = StreamingEpubWriter(epub_path, book, compression=compression)
+    chapters = []
+    try:
+        for track_num, track, job in jobs:
+            try:
+                chapter, content = job.result()
+            except Exception as e:
+                print(f"Error rendering {track.song.title}: {e}")
+                continue
+            if chapter is None:
+                continue
+            book.add_item(chapter)
+            for image in chapter.images:
+                book.add_item(image)
+            writer.write_chapter(chapter, content)
+            chapters.append(chapter)
+    except BaseException:
+        writer.out.close()
+        raise
+    spine.extend(chapters)
+    finish_book(book, chapters, spine, getattr(album, 'sections', None))
+    writer.close()
+
+
+# zipfile compression type and level for each --compression mode
+EPUB_COMPRESSION = {
+    "store": (zipfile.ZIP_STORED, None),
+    "fast": (zipfile.ZIP_DEFLATED, 1),
+    "default": (zipfile.ZIP_DEFLATED, None),
+    "best": (zipfile.ZIP_DEFLATED, 9),
+}
+
+
+def epub_compression(output_format, compression=None):
+    """The requested mode, else store-only for EPUBs that only feed the AZW3 converter."""
+    if compression:
+        return compression
+    return "store" if output_format.lower() == "azw3" else "default"
+
+
+class CompressedEpubWriter(epub.EpubWriter):
+    """EpubWriter with a choice of zip compression (ebooklib always uses the default level)."""
+
+    def __init__(self, name, book, options=None, compression="default"):
+        super().__init__(name, book, options)
+        self.compression = compression
+
+    def _open_archive(self):
+        compress_type, level = EPUB_COMPRESSION[self.compression]
+        out = zipfile.ZipFile(self.file_name, 'w', compress_type, compresslevel=level)
+        out.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        return out
+
+    def write(self):
+        self.out = self._open_archive()
+        self._write_container()
+        self._write_opf()
+        self._write_items()
+        self.out.close()
+
+
+def report_epub_write(epub_path, compression, seconds):
+    print(f"Wrote {epub_path}: {os.path.getsize(epub_path) / 1024:.1f} KiB in {seconds:.2f}s "
+          f"({compression} compression)")
+
+
+def write_epub(epub_path, book, compression="default", options=None):
+    """Write the book like epub.write_epub, with the given compression mode."""
+    start = time.perf_counter()
+    with profiler.stage("write_epub", compression=compression):
+        writer = CompressedEpubWriter(epub_path, book, options, compression)
+        writer.process()
+        writer.write()
+    report_epub_write(epub_path, compression, time.perf_counter() - start)
+
+
+class StreamingEpubWriter(CompressedEpubWriter):
+    """EpubWriter that puts each chapter into the archive as soon as it is added.
+
+    Written chapters keep only their title and file name, which is all the
+    manifest, spine and navigation need, so memory does not grow with the
+    number of tracks. ``close`` writes the remaining items and the package files.
+    """
+
+    def __init__(self, name, book, options=None, compression="default"):
+        super().__init__(name, book, options, compression)
+        self.out = self._open_archive()
+        self._written = set()
+
+    def write_chapter(self, chapter, content=None):
+        """Write the chapter, or ``content`` as-is when it is already serialized."""
+        if content is None:
+            for plg in self.options.get('plugins', []):
+                if hasattr(plg, 'html_before_write'):
+                    plg.html_before_write(self.book, chapter)
+            content = chapter.get_content()
+        self.out.writestr(f'{self.book.FOLDER_NAME}/{chapter.file_name}', content)
+        self._written.add(chapter.file_name)
+        for image in getattr(chapter, 'images', ()):
+            self.out.writestr(f'{self.book.FOLDER_NAME}/{image.file_name}', image.get_content())
+            self._written.add(image.file_name)
+            image.content = b''
+
+        # the navigation scans chapters for page breaks, which lyrics never have
+        chapter.content = '<html><body><div></div></body></html>'
+
+    def _write_items(self):
+        for item in self.book.get_items():
+            if item.file_name in self._written:
+                continue
+            if isinstance(item, epub.EpubNcx):
+                self.out.writestr(f'{self.book.FOLDER_NAME}/{item.file_name}', self._get_ncx())
+            elif isinstance(item, epub.EpubNav):
+                self.out.writestr(f'{self.book.FOLDER_NAME}/{item.file_name}', self._get_nav(item))
+            elif item.manifest:
+                self.out.writestr(f'{self.book.FOLDER_NAME}/{item.file_name}', item.get_content())
+            else:
+                self.out.writestr(item.file_name, item.get_content())
+
+    def close(self):
+        for plg in self.options.get('plugins', []):
+            if hasattr(plg, 'before_write'):
+                plg.before_write(self.book)
+        self._write_container()
+        self._write_opf()
+        self._write_items()
+        self.out.close()
+
+
+_DONE = object()
+
+# Bump whenever chapter markup changes, so incremental builds re-render every chapter
+RENDER_VERSION = 1
+
+
+def track_digest(track_num, track):
+    """Hash of everything a track's chapter is rendered from."""
+    song = getattr(track, 'song', None)
+    payload = [RENDER_VERSION, track_num, getattr(song, 'title', None), getattr(song, 'lyrics', None),
+               [referent.to_json() for referent in getattr(track, 'annotations', None) or ()],
+               getattr(song, 'song_art_image_url', None) if assets.song_art else None,
+               normalizer.keep_unicode]
+    return hashlib.sha256(json.dumps(payload, default=str).encode("utf-8")).hexdigest()
+
+
+def archive_fingerprint(path):
+    """Size and modification time, enough to tell whether the EPUB was rewritten."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_build_index(epub_path):
+    """Return the chapter digests of the previous build and its archive, if both exist.
+
+    The index is only trusted for the EPUB it was written with; one rewritten
+    since, by a full build for example, is rendered again from scratch.
+    """
+    index_path = f"{epub_path}.index.json"
+    if not (os.path.exists(index_path) and os.path.exists(epub_path)):
+        return {}, None
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("archive") != archive_fingerprint(epub_path):
+            print(f"Ignoring previous build: {epub_path} changed since {index_path} was written")
+            return {}, None
+        return index.get("chapters", {}), zipfile.ZipFile(epub_path)
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        print(f"Ignoring previous build: {e}")
+        return {}, None
+
+
+def build_ebook_streaming(genius, album, output_format="epub", workers=1,
+                          journal_dir=None, resume=False, incremental=False, compression=None):
+    """Fetch, render and write the album as overlapping stages connected by queues.
+
+    Tracks are fetched on a thread pool, a render thread annotates each track as
+    soon as it arrives, and this thread writes every finished chapter straight
+    into the archive. Track data is released once its chapter is rendered.
+    The spine and navigation follow the album order whatever order the tracks
+    finish in.
+
+    With ``incremental`` a digest of each track's lyrics and referents is kept
+    in ``<book>.epub.index.json``; chapters whose digest did not change are
+    copied from the previous EPUB instead of being annotated and rendered again.
+    """
+    book, spine = start_book(album)
+    filename_base = book_filename_base(album)
+    epub_path = f"{filename_base}.epub"
+    options = None
+    if output_format.lower() not in ("epub", "azw3"):
+        print(f"Unsupported format: {output_format}. Using EPUB instead.")
+        options = {"plugins": [BooktypeFootnotes(booktype_book=book)]}
+
+    previous_index, previous_archive = load_build_index(epub_path) if incremental else ({}, None)
+    # The previous archive is read while the new one is written, so write next to it
+    write_path = f"{epub_path}.partial" if incremental else epub_path
+    compression = epub_compression(output_format, compression)
+    start = time.perf_counter()
+    writer = StreamingEpubWriter(write_path, book, options, compression)
+
+    album.fetch_errors = []
+    fetched = queue.Queue()
+    rendered = queue.Queue()
+    journal = FetchJournal(journal_dir, album.id, resume) if journal_dir else None
+    digests = {}
+
+    def on_fetched(track_num, track, future):
+        error = future.exception()
+        if error is not None:
+            print(f"Error fetching lyrics for {track.song.title}: {error}")
+            album.fetch_errors.append((track_num, track.song.title, str(error)))
+        fetched.put((track_num, track))
+
+    def reuse_chapter(track_num, track, digest):
+        """Return the previous build's chapter bytes if the track did not change."""
+        file_name = f'song_{track_num}.xhtml'
+        if previous_archive is None or previous_index.get(file_name) != digest:
+            return None
+        try:
+            return previous_archive.read(f'{book.FOLDER_NAME}/{file_name}')
+        except KeyError:
+            return None
+
+    def reuse_images(track_num):
+        file_name = f'images/song_{track_num}.jpg'
+        try:
+            content = previous_archive.read(f'{book.FOLDER_NAME}/{file_name}')
+        except KeyError:
+            return []
+        return [epub.EpubImage(uid=f"song_art_{track_num}", file_name=file_name,
+                               media_type="image/jpeg", content=content)]
+
+    def render_stage(count):
+        try:
+            for _ in range(count):
+                track_num, track = fetched.get()
+                song = getattr(track, 'song', None)
+                try:
+                    content = None
+                    if incremental:
+                        digest = track_digest(track_num, track)
+                        content = reuse_chapter(track_num, track, digest)
+                        digests[f'song_{track_num}.xhtml'] = digest
+                    if content is not None:
+                        chapter = epub.EpubHtml(title=song.title, file_name=f'song_{track_num}.xhtml')
+                        chapter.images = reuse_images(track_num)
+                        reused.append(track_num)
+                        rendered.put((track_num, (chapter, content)))
+                    elif chapter_renderer.enabled:
+                        # rendered in another process, written once its future resolves
+                        rendered.put((track_num, chapter_renderer.submit(track_num, track)))
+                    else:
+                        rendered.put((track_num, (create_chapter(track_num, track), None)))
+                except Exception as e:
+                    print(f"Error rendering track {track_num} ({getattr(song, 'title', 'no song')}): {e}")
+                    rendered.put((track_num, (None, None)))
+                if song:
+                    # The chapter holds everything the book needs from here on
+                    song.lyrics = ""
+                    track.annotations = []
+        finally:
+            # the writer loop stops on _DONE, it must come even if this stage fails
+            rendered.put(_DONE)
+
+    tracks = list(enumerate(album.tracks, 1))
+    pending = []
+    for track_num, track in tracks:
+        if hasattr(track, 'song') and track.song:
+            pending.append((track_num, track))
+        else:
+            # nothing to fetch, the render stage reports it as skipped
+            fetched.put((track_num, track))
+
+    chapters = {}
+    reused = []
+    renderer = threading.Thread(target=render_stage, args=(len(tracks),), daemon=True)
+    renderer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for track_num, track in pending:
+                future = executor.submit(fetch_track_data, genius, track, journal)
+                future.add_done_callback(lambda f, n=track_num, t=track: on_fetched(n, t, f))
+
+            for track_num, result in iter(rendered.get, _DONE):
+                if isinstance(result, Future):
+                    try:
+                        result = result.result()
+                    except Exception as e:
+                        print(f"Error rendering {album.tracks[track_num - 1].song.title}: {e}")
+                        continue
+                chapter, content = result
+                if chapter is None:
+                    continue
+                book.add_item(chapter)
+                for image in chapter.images:
+                    book.add_item(image)
+                with profiler.stage("write chapter", track=track_num):
+                    writer.write_chapter(chapter, content)
+                chapters[track_num] = chapter
+    except BaseException:
+        writer.out.close()
+        raise
+    finally:
+        if journal is not None:
+            journal.close()
+        if previous_archive is not None:
+            previous_archive.close()
+    renderer.join()
+
+    ordered = [chapters[track_num] for track_num in sorted(chapters)]
+    spine.extend(ordered)
+    finish_book(book, ordered, spine)
+    with profiler.stage("write_epub", compression=compression):
+        writer.close()
+    # chapters were written as they arrived, so this covers the whole build
+    report_epub_write(write_path, compression, time.perf_counter() - start)
+    album.fetch_errors.sort()
+    print(f"Chapters written: {len(ordered)} of {len(tracks)} tracks")
+
+    if incremental:
+        os.replace(write_path, epub_path)
+        # tracks without a chapter are left out, so they are rendered again next time
+        written = {chapter.file_name: digests[chapter.file_name] for chapter in ordered}
+        with open(f"{epub_path}.index.json", "w", encoding="utf-8") as f:
+            json.dump({"album_id": album.id, "archive": archive_fingerprint(epub_path), "chapters": written},
+                      f, indent=1)
+        print(f"Chapters reused from the previous build: {len(reused)}")
+
+    if output_format.lower() == "azw3":
+        # an incremental build needs the EPUB as the base for the next run
+        return convert_to_azw3(epub_path, filename_base, keep_epub=incremental)
+    return epub_path
+
+
+def write_profile(path):
+    print(profiler.summary())
+    profiler.write(path)
+    print(f"Profile written to {path}")
+
+
+def read_manifest(path):
+    """Read (artist, album) pairs from a CSV or JSON manifest."""
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith(".json"):
+            data = json.load(f)
+            rows = [(row["artist"], row["album"]) if isinstance(row, dict) else (row[0], row[1])
+                    for row in data]
+        else:
+            reader = csv.reader(f)
+            rows = [tuple(cell.strip() for cell in row[:2]) for row in reader if row and row[0].strip()]
+            # Skip the header row if there is one
+            if rows and [cell.lower() for cell in rows[0]] == ["artist", "album"]:
+                rows = rows[1:]
+    return [(artist, album) for artist, album in rows if artist and album]
+
+
+BUNDLE_VERSION = 1
+
+
+def export_bundle(album, path):
+    """Write a fetched album as a gzip-compressed JSON bundle.
+
+    The bundle holds everything the book is rendered from - the album, every
+    track's song with its lyrics and referents, and the processed cover (and
+    song art with --song-art) - so render can build it without the network.
+    """
+    urls = [album.cover_art_url] if album.cover_art_url else []
+    if assets.song_art:
+        urls += [track.song.song_art_image_url for track in album.tracks if track.song.song_art_image_url]
+    images = {}
+    for url in urls:
+        try:
+            images[url] = base64.b64encode(assets.get(url)).decode("ascii")
+        except Exception as e:
+            print(f"Error bundling image {url}: {e}")
+
+    album_body = album.to_dict()
+    album_body.pop("tracks", None)
+    tracks = []
+    for track in album.tracks:
+        annotations = getattr(track, "annotations", None)
+        tracks.append({"number": track.number, "song": track.song.to_dict(),
+                       "annotations": None if annotations is None else [r.to_json() for r in annotations]})
+    bundle = {"version": BUNDLE_VERSION, "album": album_body, "tracks": tracks,
+              "fetch_errors": getattr(album, "fetch_errors", []), "images": images}
+
+    with gzip.open(f"{path}.tmp", "wt", encoding="utf-8") as f:
+        json.dump(bundle, f, separators=(",", ":"))
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def import_bundle(path):
+    """Rebuild the album written by export_bundle, ready for create_epub."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        bundle = json.load(f)
+    if bundle.get("version") != BUNDLE_VERSION:
+        raise ValueError(f"Unsupported bundle version {bundle.get('version')} in {path}")
+
+    tracks = []
+    for entry in bundle["tracks"]:
+        track = Track(None, {"number": entry["number"], "song": entry["song"]}, entry["song"].get("lyrics", ""))
+        if entry["annotations"] is not None:
+            track.annotations = [Referent.from_json(referent) for referent in entry["annotations"]]
+        tracks.append(track)
+    album = Album(None, bundle["album"], tracks)
+    album.fetch_errors = [tuple(error) for error in bundle.get("fetch_errors", [])]
+    for url, data in bundle.get("images", {}).items():
+        assets.preload(url, base64.b64decode(data))
+    return album
+
+
+def bundle_filename(album):
+    return f"{book_filename_base(album)}.bundle.json.gz"
+
+
+def render_bundle(path, output_format="epub", compression=None):
+    """Build the ebook for one bundle, offline."""
+    album = import_bundle(path)
+    print(f"Rendering {album.name} by {album.artist.name} from {path}...")
+    return create_epub(album, output_format, compression)
+
+
+def _render_bundle_job(path, output_format, compression, keep_unicode, song_art, image_size):
+    # Runs in a render process, which does not inherit the command line configuration
+    normalizer.configure(keep_unicode=keep_unicode)
+    assets.configure(max_size=image_size, song_art=song_art, offline=True)
+    try:
+        return render_bundle(path, output_format, compression)
+    finally:
+        # The pool reuses this process for later bundles, the converter
+        # starts fresh Calibre workers for them after closing
+        azw3_converter.close()
+
+
+def build_album(genius, artist_name, album_name, output_format="epub", workers=1,
+                journal_dir=None, resume=False, stream=False, incremental=False, compression=None):
+    """Fetch and write a single album, returning a summary entry instead of raising."""
+    result = {"artist": artist_name, "album": album_name, "status": "failed",
+              "output": None, "error": None, "tracks": 0, "track_errors": 0}
+    start = time.monotonic()
+    try:
+        if stream:
+            album_data = find_album(genius, artist_name, album_name)
+            if album_data:
+                result["output"] = build_ebook_streaming(genius, album_data, output_format, workers,
+                                                         journal_dir, resume, incremental, compression)
+        else:
+            album_data = get_album_data(artist_name, album_name, None, workers, genius=genius,
+                                        journal_dir=journal_dir, resume=resume)
+            if album_data:
+                result["output"] = create_epub(album_data, output_format, compression)
+        if album_data:
+            result["tracks"] = len(album_data.tracks)
+            result["track_errors"] = len(album_data.fetch_errors)
+            result["status"] = "ok"
+        else:
+            result["error"] = "Album not found or could not be fetched"
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.monotonic() - start, 2)
+    return result
+
+
+def build_manifest(genius, entries, output_format="epub", workers=1, album_workers=1,
+                   journal_dir=None, resume=False, stream=False, incremental=False, compression=None):
+    """Build every album of the manifest with one shared client, keeping the manifest order."""
+    with ThreadPoolExecutor(max_workers=album_workers) as executor:
+        futures = [executor.submit(build_album, genius, artist_name, album_name, output_format, workers,
+                                   journal_dir, resume, stream, incremental, compression)
+                   for artist_name, album_name in entries]
+        return [future.result() for future in futures]
+
+
+def add_fetch_arguments(parser):
     parser.add_argument("--api-key", help="Genius API key", default= os.getenv("GENIUS_API_KEY"))
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of tracks fetched concurrently (default: 1)")
+    parser.add_argument("--cache-dir", default=".genius_cache",
+                        help="Directory for cached Genius responses (default: .genius_cache)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response cache")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore cached responses and fetch everything again (the cache is still updated)")
+    parser.add_argument("--journal-dir", default=".genius_journal",
+                        help="Directory where fetched tracks are checkpointed (default: .genius_journal)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip tracks already checkpointed by a previous, interrupted run")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="Maximum requests per second across all workers (default: 10)")
+
+
+def add_render_arguments(parser):
     parser.add_argument("--format", choices=["epub", "azw3"], default="epub", 
                         help="Output format (epub or azw3)")
-    parser.add_argument("--debug", action="store_true", help="Enable debug output")
-    
-    args = parser.parse_args()
-    
-    if not args.api_key:
+    parser.add_argument("--keep-unicode", action="store_true",
+                        help="Keep accented and non-Latin characters instead of transliterating to ASCII")
+    parser.add_argument("--compression", choices=list(EPUB_COMPRESSION),
+                        help="Zip compression of the EPUB: store, fast, default or best "
+                             "(default: store for the intermediate EPUB of azw3, default otherwise)")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="Number of processes annotating and rendering chapters (default: 1, "
+                             "renders in the main process)")
+    parser.add_argument("--convert-workers", type=int, default=2,
+                        help="Number of parallel Calibre workers for AZW3 conversion (default: 2)")
+
+
+def add_common_arguments(parser):
+    parser.add_argument("--song-art", action="store_true",
+                        help="Embed each song's cover art in its chapter")
+    parser.add_argument("--image-size",
+                        help="Images are downscaled to fit WIDTHxHEIGHT (default: 1072x1448); "
+                             "needs Pillow (the 'images' extra), otherwise images are embedded as downloaded")
+    parser.add_argument("--debug", action="store_true",
+                        help="Enable debug output with stage timings and HTTP counters")
+    parser.add_argument("--profile-file", default="genius2ebook_profile.json",
+                        help="Where --debug writes its Chrome trace/JSON profile "
+                             "(default: genius2ebook_profile.json)")
+
+
+def configure(parser, args):
+    """Validate the shared options and configure the process-wide helpers from them."""
+    if hasattr(args, "api_key") and not args.api_key:
         print("ERROR: Genius API key is required. Provide it with --api-key or set GENIUS_API_KEY environment variable.")
         sys.exit(1)
+
+    if getattr(args, "workers", 1) < 1 or getattr(args, "album_workers", 1) < 1:
+        print("ERROR: --workers and --album-workers must be at least 1.")
+        sys.exit(1)
+
+    if hasattr(args, "rate"):
+        if args.rate <= 0:
+            print("ERROR: --rate must be positive.")
+            sys.exit(1)
+        rate_limiter.configure(max_rate=args.rate)
+    if hasattr(args, "convert_workers"):
+        azw3_converter.configure(max_workers=max(args.convert_workers, 1))
+        chapter_renderer.configure(max_workers=max(args.render_workers, 1))
+    if Image is None and (args.image_size or args.song_art):
+        print("WARNING: Pillow is not installed, images are embedded as downloaded without downscaling. "
+              "Install it with: pip install 'genius2ebook[images]'")
+    try:
+        image_size = tuple(int(x) for x in (args.image_size or "1072x1448").lower().split("x"))
+    except ValueError:
+        image_size = ()
+    if len(image_size) != 2:
+        parser.error("--image-size must look like 1072x1448")
+    args.image_size = image_size
+    if hasattr(args, "keep_unicode"):
+        normalizer.configure(keep_unicode=args.keep_unicode)
+    cache_dir = None if getattr(args, "no_cache", True) else args.cache_dir
+    assets.configure(cache_dir=cache_dir, max_size=image_size, song_art=args.song_art)
     
     # Set LyricsGenius verbose mode if debug is enabled
     if args.debug:
         print("Debug mode enabled.")
+        profiler.enabled = True
+        atexit.register(write_profile, args.profile_file)
+
+
+def fetch_main(argv):
+    """fetch: download albums into bundles that render builds ebooks from offline."""
+    parser = argparse.ArgumentParser(prog="genius_2_ebook.py fetch",
+                                     description="Fetch albums from Genius into offline bundles")
+    parser.add_argument("artist", nargs="?", help="Artist name")
+    parser.add_argument("album", nargs="?", help="Album name")
+    parser.add_argument("--manifest", help="CSV or JSON file with artist/album pairs to fetch")
+    parser.add_argument("-o", "--output", help="Bundle path for a single album "
+                                               "(default: <Artist> - <Album>.bundle.json.gz)")
+    parser.add_argument("--bundle-dir", default=".",
+                        help="Directory the bundles are written to (default: current directory)")
+    add_fetch_arguments(parser)
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if not args.manifest and not (args.artist and args.album):
+        parser.error("artist and album are required unless --manifest is given")
+    configure(parser, args)
+
+    cache = None if args.no_cache else ResponseCache(args.cache_dir, refresh=args.refresh)
+    genius = create_genius_client(args.api_key, cache, pool_size=max(args.workers, 10))
+    entries = read_manifest(args.manifest) if args.manifest else [(args.artist, args.album)]
+    os.makedirs(args.bundle_dir, exist_ok=True)
+
+    failed = 0
+    for artist_name, album_name in entries:
+        album_data = get_album_data(artist_name, album_name, None, args.workers, genius=genius,
+                                    journal_dir=args.journal_dir, resume=args.resume)
+        if not album_data:
+            print(f"Failed to fetch {artist_name} - {album_name}")
+            failed += 1
+            continue
+        path = args.output if args.output and not args.manifest else \
+            os.path.join(args.bundle_dir, bundle_filename(album_data))
+        with profiler.stage("export_bundle"):
+            export_bundle(album_data, path)
+        print(f"Bundle written: {path}")
+
+    if cache is not None:
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses")
+    print(rate_limiter.summary())
+    if failed:
+        sys.exit(1)
+
+
+def render_main(argv):
+    """render: build ebooks from bundles written by fetch, without the network."""
+    parser = argparse.ArgumentParser(prog="genius_2_ebook.py render",
+                                     description="Build ebooks from album bundles offline")
+    parser.add_argument("bundles", nargs="+", help="Bundle files written by fetch")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of bundles rendered in parallel processes (default: 1)")
+    add_render_arguments(parser)
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(parser, args)
+    # images missing from a bundle are left out rather than downloaded
+    assets.offline = True
+
+    results = []
+    if args.jobs > 1 and len(args.bundles) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(_render_bundle_job, path, args.format, args.compression, args.keep_unicode,
+                                       args.song_art, args.image_size) for path in args.bundles]
+            for path, future in zip(args.bundles, futures):
+                try:
+                    results.append((path, future.result(), None))
+                except Exception as e:
+                    results.append((path, None, e))
+    else:
+        for path in args.bundles:
+            try:
+                results.append((path, render_bundle(path, args.format, args.compression), None))
+            except Exception as e:
+                results.append((path, None, e))
+
+    for path, output, error in results:
+        if output:
+            print(f"Ebook created successfully: {output}")
+        else:
+            print(f"Failed to render {path}: {error or 'no output'}")
+    if any(not output for _, output, _ in results):
+        sys.exit(1)
+
+
+def print_troubleshooting_tips():
+    print("\nTroubleshooting tips:")
+    print("1. Check that your Genius API key is correct")
+    print("2. Try with the exact artist and album name as listed on Genius.com")
+    print("3. Some albums might not be available on Genius or might be listed differently")
+    print("4. Run with --debug flag for more information")
+
+
+def main():
+    load_dotenv() 
+    if len(sys.argv) > 1 and sys.argv[1] == "fetch":
+        return fetch_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == "render":
+        return render_main(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description="Generate an ebook of album lyrics and annotations",
+                                     epilog="Use 'fetch' and 'render' subcommands to fetch albums into "
+                                            "offline bundles and build ebooks from them separately.")
+    parser.add_argument("artist", nargs="?", help="Artist name")
+    parser.add_argument("album", nargs="?", help="Album name")
+    parser.add_argument("--manifest",
+                        help="CSV or JSON file with artist/album pairs to build in one run")
+    parser.add_argument("--discography", action="store_true",
+                        help="Build every album of the artist, fetching songs shared between albums once")
+    parser.add_argument("--combined", action="store_true",
+                        help="With --discography, write one book with every song instead of one per album")
+    parser.add_argument("--album-workers", type=int, default=2,
+                        help="Number of manifest albums built concurrently (default: 2)")
+    parser.add_argument("--report", help="Where to write the manifest summary report "
+                                         "(default: <manifest>.report.json)")
+    add_fetch_arguments(parser)
+    add_render_arguments(parser)
+    parser.add_argument("--stream", action="store_true",
+                        help="Fetch, annotate and write chapters as overlapping stages, "
+                             "writing each chapter into the EPUB as soon as its track is done")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-render chapters whose lyrics or annotations changed since the "
+                             "previous build, copying the others from its EPUB (implies --stream)")
+    add_common_arguments(parser)
+    
+    args = parser.parse_args()
+
+    if args.discography and not args.artist:
+        parser.error("artist is required with --discography")
+    if args.discography and (args.stream or args.incremental):
+        parser.error("--stream and --incremental are not supported with --discography")
+    if not args.manifest and not args.discography and not (args.artist and args.album):
+        parser.error("artist and album are required unless --manifest or --discography is given")
+
+    if args.incremental:
+        args.stream = True
+
+    configure(parser, args)
     
-    album_data = get_album_data(args.artist, args.album, args.api_key)
+    cache = None if args.no_cache else ResponseCache(args.cache_dir, refresh=args.refresh)
+
+    if args.manifest:
+        entries = read_manifest(args.manifest)
+        print(f"Building {len(entries)} albums from {args.manifest}...")
+        genius = create_genius_client(args.api_key, cache,
+                                      pool_size=max(args.workers * args.album_workers, 10))
+        results = build_manifest(genius, entries, args.format, args.workers, args.album_workers,
+                                 args.journal_dir, args.resume, args.stream, args.incremental,
+                                 args.compression)
+
+        report_path = args.report or f"{os.path.splitext(args.manifest)[0]}.report.json"
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"albums": results,
+                       "http": rate_limiter.metrics,
+                       "built": sum(1 for r in results if r["status"] == "ok"),
+                       "failed": sum(1 for r in results if r["status"] != "ok")}, f, indent=2)
+
+        print("\nSummary:")
+        for r in results:
+            detail = r["output"] if r["status"] == "ok" else r["error"]
+            print(f"  [{r['status']}] {r['artist']} - {r['album']} ({r['seconds']}s): {detail}")
+        if cache is not None:
+            print(f"Cache: {cache.hits} hits, {cache.misses} misses")
+        print(rate_limiter.summary())
+        print(f"Report written to {report_path}")
+        if any(r["status"] != "ok" for r in results):
+            sys.exit(1)
+        return
+
+    if args.discography:
+        genius = create_genius_client(args.api_key, cache, pool_size=max(args.workers, 10))
+        try:
+            outputs = build_discography(genius, args.artist, args.format, args.workers, args.journal_dir,
+                                        args.resume, args.combined, args.compression)
+        except Exception as e:
+            print(f"Error: {e}")
+            outputs = []
+        if cache is not None:
+            print(f"Cache: {cache.hits} hits, {cache.misses} misses")
+        for output in outputs:
+            print(f"Ebook created successfully: {output}")
+        print(rate_limiter.summary())
+        if not outputs:
+            print("Failed to create any ebook.")
+            print_troubleshooting_tips()
+            sys.exit(1)
+        return
+
+    output_file = None
+    if args.stream:
+        genius = create_genius_client(args.api_key, cache, pool_size=max(args.workers, 10))
+        album_data = find_album(genius, args.artist, args.album)
+        if album_data:
+            print(f"Found album: {album_data.name} by {album_data.artist.name}")
+            print("Creating ebook...")
+            output_file = build_ebook_streaming(genius, album_data, args.format, args.workers,
+                                                args.journal_dir, args.resume, args.incremental,
+                                                args.compression)
+    else:
+        album_data = get_album_data(args.artist, args.album, args.api_key, args.workers, cache,
+                                    journal_dir=args.journal_dir, resume=args.resume)
+        if album_data:
+            print("Creating ebook...")
+            output_file = create_epub(album_data, args.format, args.compression)
+    if cache is not None:
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses")
     
-    if album_data:
-        print("Creating ebook...")
-        output_file = create_epub(album_data, args.format)
+    if output_file:
         print(f"Ebook created successfully: {output_file}")
+        print(rate_limiter.summary())
     else:
         print("Failed to create ebook.")
-        print("\nTroubleshooting tips:")
-        print("1. Check that your Genius API key is correct")
-        print("2. Try with the exact artist and album name as listed on Genius.com")
-        print("3. Some albums might not be available on Genius or might be listed differently")
-        print("4. Run with --debug flag for more information")
+        print_troubleshooting_tips()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+from functools import lru_cache
+
+from unidecode import unidecode
+
+
+# Typographic apostrophes for readers that render Unicode
+APOSTROPHES = str.maketrans({"'": "’"})
+
+
+class Normalizer:
+    """Prepares lyrics and annotation fragments for the book.
+
+    By default text is transliterated to ASCII with unidecode. Lines are
+    normalised one at a time through a bounded memo, so repeated choruses and
+    recurring fragments are only transliterated once, and pure-ASCII text
+    skips transliteration altogether. With keep_unicode the text is kept as is,
+    apart from typographic apostrophes.
+    """
+
+    def __init__(self, keep_unicode=False, memo_size=8192):
+        self.keep_unicode = keep_unicode
+        self.memo_size = memo_size
+        self._transliterate = lru_cache(maxsize=memo_size)(unidecode)
+
+    def configure(self, keep_unicode=None, memo_size=None):
+        if keep_unicode is not None:
+            self.keep_unicode = keep_unicode
+        if memo_size is not None and memo_size != self.memo_size:
+            self.memo_size = memo_size
+            self._transliterate = lru_cache(maxsize=memo_size)(unidecode)
+
+    def normalize(self, text: str) -> str:
+        """Normalise a single line or fragment."""
+        if self.keep_unicode:
+            return text.translate(APOSTROPHES)
+        if text.isascii():
+            return text
+        return self._transliterate(text)
+
+    def normalize_lyrics(self, lyrics: str) -> str:
+        """Normalise full lyrics, indenting every line after the first by a space."""
+        return "\n ".join(self.normalize(line) for line in lyrics.split("\n"))
+
+    def cache_info(self):
+        return self._transliterate.cache_info()
+
+
+# Shared by the whole process, configured from the command line
+normalizer = Normalizer()